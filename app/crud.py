@@ -1,3 +1,4 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from . import models, schemas
 from datetime import datetime, timedelta, time
@@ -9,7 +10,7 @@ def get_appointment_by_doctor_and_time(db: Session, doctor_name: str, start_time
         models.Appointment.start_time == start_time
     ).first()
 
-def create_appointment(db: Session, appointment: schemas.AppointmentCreate):
+def create_appointment(db: Session, appointment: schemas.AppointmentCreate, commit: bool = True):
     appt_data = appointment.model_dump()
     # Remove trigger_robot if present (though schema should have handled it in main, safe to check)
     if "trigger_robot" in appt_data:
@@ -22,6 +23,10 @@ def create_appointment(db: Session, appointment: schemas.AppointmentCreate):
 
     db_appointment = models.Appointment(**appt_data)
     db.add(db_appointment)
+    if not commit:
+        # Part of a larger transaction (sync); the caller commits
+        db.flush()
+        return db_appointment
     db.commit()
     db.refresh(db_appointment)
     return db_appointment
@@ -34,22 +39,6 @@ def get_appointments(db: Session, skip: int = 0, limit: int = 100):
 def get_appointment(db: Session, appointment_id: int):
     return db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
 
-def get_appointments_for_range(db: Session, agenda: Optional[str], start_date: datetime.date, end_date: datetime.date):
-    
-    # Combine dates with min/max times to cover full days
-    range_start = datetime.combine(start_date, time.min)
-    range_end = datetime.combine(end_date, time.max)
-    
-    query = db.query(models.Appointment).filter(
-        models.Appointment.start_time >= range_start,
-        models.Appointment.start_time <= range_end
-    )
-    
-    if agenda:
-        query = query.filter(models.Appointment.agenda == agenda)
-        
-    return query.all()
-
 def sync_appointments(db: Session, appointments: List[schemas.AppointmentCreate]):
     # 1. Determine Window
     sorted_appts = sorted(appointments, key=lambda x: x.start_time)
@@ -77,9 +66,11 @@ def sync_appointments(db: Session, appointments: List[schemas.AppointmentCreate]
 
     for appt in appointments:
         if (appt.doctor_name, appt.start_time) not in existing_keys:
-            create_appointment(db, appt)
+            create_appointment(db, appt, commit=False)
             created_count += 1
     
+    # Appointment changes and the occupancy refresh are committed together
+    refresh_daily_occupancy(db, min_time.date(), max_time.date())
     db.commit()
     
     return {
@@ -89,3 +80,73 @@ def sync_appointments(db: Session, appointments: List[schemas.AppointmentCreate]
         "window_start": min_time, 
         "window_end": max_time
     }
+
+def get_occupancy_for_range(db: Session, agenda: Optional[str], start_date: datetime.date, end_date: datetime.date):
+    query = db.query(models.DailyOccupancy).filter(
+        models.DailyOccupancy.date >= start_date,
+        models.DailyOccupancy.date <= end_date
+    )
+
+    if agenda:
+        query = query.filter(models.DailyOccupancy.agenda == agenda)
+
+    return query.order_by(models.DailyOccupancy.agenda, models.DailyOccupancy.date).all()
+
+def refresh_daily_occupancy(db: Session, start_date: datetime.date, end_date: datetime.date, agenda: Optional[str] = None):
+    """
+    Rebuilds daily_occupancy for the date range (optionally one agenda) from appointments.
+    Does not commit. sync_appointments commits it together with the appointment changes;
+    create_appointment commits the new row first, so there the refresh is a separate transaction.
+    """
+    # Pending deletes must be visible to the aggregation below
+    db.flush()
+
+    range_start = datetime.combine(start_date, time.min)
+    range_end = datetime.combine(end_date, time.max)
+
+    query = db.query(models.Appointment.agenda, models.Appointment.start_time).filter(
+        models.Appointment.start_time >= range_start,
+        models.Appointment.start_time <= range_end
+    )
+    stale = db.query(models.DailyOccupancy).filter(
+        models.DailyOccupancy.date >= start_date,
+        models.DailyOccupancy.date <= end_date
+    )
+    if agenda:
+        query = query.filter(models.Appointment.agenda == agenda)
+        stale = stale.filter(models.DailyOccupancy.agenda == agenda)
+
+    counts = {}
+    busy = {}
+    for appt_agenda, start_time in query:
+        key = (appt_agenda or "Unknown", start_time.date())
+        counts[key] = counts.get(key, 0) + 1
+        busy.setdefault(key, set()).add(start_time.strftime("%H:%M"))
+
+    stale.delete(synchronize_session=False)
+    db.add_all([
+        models.DailyOccupancy(
+            agenda=key[0],
+            date=key[1],
+            booked_count=count,
+            busy_slots=sorted(busy[key])
+        )
+        for key, count in counts.items()
+    ])
+
+def backfill_daily_occupancy(db: Session):
+    """
+    Builds daily_occupancy from all appointments when the table is still empty (first deploy).
+    """
+    if db.query(models.DailyOccupancy).first() is not None:
+        return
+
+    first_start, last_start = db.query(
+        func.min(models.Appointment.start_time),
+        func.max(models.Appointment.start_time)
+    ).one()
+    if first_start is None:
+        return
+
+    refresh_daily_occupancy(db, first_start.date(), last_start.date())
+    db.commit()
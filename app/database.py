@@ -1,18 +1,70 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
+import time
+from . import metrics
 
 # In a real app, use environment variables. Hardcoded for local docker setup as requested.
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:password@db/dr_soler_db")
 
+# Optional read replica for read-only endpoints; falls back to the primary when unset
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL")
+
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+replica_engine = create_engine(REPLICA_DATABASE_URL) if REPLICA_DATABASE_URL else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
 Base = declarative_base()
 
+def _instrument_engine(target_engine):
+    @event.listens_for(target_engine, "before_cursor_execute")
+    def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(target_engine, "after_cursor_execute")
+    def _record_query_time(conn, cursor, statement, parameters, context, executemany):
+        metrics.record_db_query(time.perf_counter() - conn.info["query_start_time"].pop())
+
+    @event.listens_for(target_engine, "handle_error")
+    def _discard_query_timer(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start_time"):
+            conn.info["query_start_time"].pop()
+
+_instrument_engine(engine)
+if replica_engine is not engine:
+    _instrument_engine(replica_engine)
+
+def ping():
+    """
+    Cheap connectivity check against the primary; raises OperationalError if it is unreachable.
+    """
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+def schema_ready() -> bool:
+    """
+    True once `python -m app.init_db` has created the tables; raises OperationalError if unreachable.
+    """
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        return inspector.has_table("appointments") and inspector.has_table("daily_occupancy")
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    """
+    Session for read-only endpoints, routed to the replica when one is configured.
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
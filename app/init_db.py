@@ -0,0 +1,66 @@
+"""
+One-time schema initialisation: creates missing tables and backfills daily_occupancy.
+Run once per deployment, before starting the API workers:
+
+    python -m app.init_db
+
+On Postgres an advisory lock makes concurrent runs (e.g. several containers) safe;
+the first one does the work and the rest find everything in place.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from . import crud, database, models
+
+logger = logging.getLogger("api.init_db")
+
+# Arbitrary constant identifying the schema init lock
+SCHEMA_LOCK_KEY = 804512
+
+@contextmanager
+def schema_lock():
+    """
+    Holds a session-level Postgres advisory lock for the whole init (no-op on other databases).
+    """
+    if database.engine.dialect.name != "postgresql":
+        yield
+        return
+
+    with database.engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEMA_LOCK_KEY})
+
+def init_db(max_retries: int = 30, retry_interval: float = 2):
+    for i in range(max_retries):
+        try:
+            database.ping()
+            break
+        except OperationalError as e:
+            if i == max_retries - 1:
+                raise e
+            logger.warning("Database not ready, retrying in %s seconds...", retry_interval)
+            time.sleep(retry_interval)
+
+    # Table creation and the backfill both run under the lock, so a second
+    # container waits and then finds daily_occupancy already populated
+    with schema_lock():
+        models.Base.metadata.create_all(bind=database.engine)
+        with database.SessionLocal() as db:
+            crud.backfill_daily_occupancy(db)
+
+    logger.info("Database schema ready")
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    init_db()
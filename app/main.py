@@ -1,46 +1,107 @@
-from fastapi import FastAPI, Depends, HTTPException, Security, BackgroundTasks, status
+from fastapi import FastAPI, Depends, HTTPException, Request, BackgroundTasks, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from datetime import datetime, timedelta
-from .database import get_db
-from . import models, schemas, database, crud, services
-from .security import verify_token
-import time as sys_time
-from sqlalchemy.exc import OperationalError
-
-# Retry connecting to the database
-max_retries = 10
-retry_interval = 2
-
-for i in range(max_retries):
-    try:
-        models.Base.metadata.create_all(bind=database.engine)
-        break
-    except OperationalError as e:
-        if i == max_retries - 1:
-            raise e
-        print(f"Database not ready, retrying in {retry_interval} seconds...")
-        sys_time.sleep(retry_interval)
+from datetime import date, datetime, timedelta
+from .database import get_db, get_read_db
+from . import schemas, database, crud, services, metrics
+from .security import verify_token, require_scope
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("api")
+
+# Concurrent bookings/syncs on the same agenda/day can collide on the daily_occupancy key
+OCCUPANCY_REFRESH_ATTEMPTS = 5
+
+# Seconds between readiness probes while waiting for the database at startup
+READINESS_RETRY_INTERVAL = 2
+
+
+async def wait_for_database(app: FastAPI):
+    """
+    Probes the database in the background so workers start serving immediately.
+    Schema creation is not done here: run `python -m app.init_db` once per deployment.
+    """
+    while True:
+        try:
+            await run_in_threadpool(database.ping)
+            app.state.db_ready = True
+            logger.info("Database ready")
+            return
+        except OperationalError:
+            logger.warning("Database not ready, retrying in %s seconds...", READINESS_RETRY_INTERVAL)
+            await asyncio.sleep(READINESS_RETRY_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.db_ready = False
+    readiness_task = asyncio.create_task(wait_for_database(app))
+    yield
+    readiness_task.cancel()
+
+
+app = FastAPI(dependencies=[Depends(verify_token)], lifespan=lifespan)
+metrics.instrument(
+    app,
+    dependencies=[Depends(require_scope("metrics:read"))],
+    untracked_paths=("/healthz", "/readyz"),
+)
+
+SYNC_ROWS = metrics.Counter(
+    "sync_rows_total",
+    "Appointment rows processed by /appointments/sync/.",
+    ["action"],
+)
+
+
+# Probes are plain routes so they bypass the app-level token dependency
+async def healthz(request: Request):
+    """
+    Liveness: the process is up and serving requests.
+    """
+    return JSONResponse({"status": "ok"})
 
+async def readyz(request: Request):
+    """
+    Readiness: the database is reachable and its schema exists, so traffic can be routed here.
+    """
+    if request.app.state.db_ready:
+        try:
+            if await run_in_threadpool(database.schema_ready):
+                return JSONResponse({"status": "ready"})
+            return JSONResponse({"status": "schema missing, run python -m app.init_db"}, status_code=503)
+        except OperationalError:
+            pass
+    return JSONResponse({"status": "unavailable"}, status_code=503)
 
-app = FastAPI(dependencies=[Depends(verify_token)])
+app.add_route("/healthz", healthz, methods=["GET"])
+app.add_route("/readyz", readyz, methods=["GET"])
 
 
-@app.post("/appointments/", response_model=schemas.Appointment)
+@app.post("/appointments/", response_model=schemas.Appointment, dependencies=[Depends(require_scope("appointments:write"))])
 def create_appointment(
     appointment: schemas.AppointmentCreate, 
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    token: str = Depends(verify_token)
+    db: Session = Depends(get_db)
 ):
-    print(f"DEBUG: Received appointment creation request: {appointment}")
+    logger.debug("Received appointment creation request: %s", appointment)
     
     # Check for existing appointment
     existing_appt = crud.get_appointment_by_doctor_and_time(
         db, appointment.doctor_name, appointment.start_time
     )
     if existing_appt:
-        print(f"DEBUG: Appointment already exists at {appointment.start_time}")
+        logger.debug("Appointment already exists at %s", appointment.start_time)
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="This time slot is already booked."
@@ -48,15 +109,27 @@ def create_appointment(
 
     # Extract trigger flag before CRUD
     trigger_robot = appointment.trigger_robot
-    print(f"DEBUG: trigger_robot flag = {trigger_robot}")
+    logger.debug("trigger_robot flag = %s", trigger_robot)
     
     # Create in DB
     db_appointment = crud.create_appointment(db, appointment)
-    print(f"DEBUG: Appointment created in DB with ID: {db_appointment.id}")
+    booking_date = db_appointment.start_time.date()
+    booking_agenda = db_appointment.agenda
+    for attempt in range(OCCUPANCY_REFRESH_ATTEMPTS):
+        try:
+            crud.refresh_daily_occupancy(db, booking_date, booking_date, booking_agenda)
+            db.commit()
+            break
+        except IntegrityError:
+            # A concurrent booking refreshed the same day first; recompute on top of it
+            db.rollback()
+    else:
+        # The appointment itself is committed; the next sync rebuilds this day's summary
+        logger.warning("Could not refresh daily_occupancy for %s on %s", booking_agenda, booking_date)
+    logger.debug("Appointment created in DB with ID: %s", db_appointment.id)
 
     # Trigger Robot if requested
     if trigger_robot:
-        print(f"DEBUG: Preparing to trigger robot...")
         # Prepare payload
         robot_payload = appointment.model_dump()
         del robot_payload["trigger_robot"]
@@ -67,134 +140,116 @@ def create_appointment(
         if isinstance(robot_payload.get("end_time"), datetime):
             robot_payload["end_time"] = robot_payload["end_time"].isoformat()
         
-        print(f"DEBUG: Adding robot task to background with payload: {robot_payload}")
-        background_tasks.add_task(services.execute_robot_task, robot_payload, token)
-        print(f"DEBUG: Robot task added to background tasks")
+        logger.debug("Adding robot task to background with payload: %s", robot_payload)
+        background_tasks.add_task(services.execute_robot_task, robot_payload)
     else:
-        print(f"DEBUG: Robot trigger NOT requested (trigger_robot={trigger_robot})")
+        logger.debug("Robot trigger NOT requested (trigger_robot=%s)", trigger_robot)
 
     return db_appointment
 
-@app.get("/appointments/", response_model=List[schemas.Appointment])
-def read_appointments(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@app.get("/appointments/", response_model=List[schemas.Appointment], dependencies=[Depends(require_scope("appointments:read"))])
+def read_appointments(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     appointments = crud.get_appointments(db, skip=skip, limit=limit)
     return appointments
 
 
-@app.get("/appointments/available_slots/")
-def get_available_slots(agenda: Optional[str] = None, db: Session = Depends(get_db)):
+def _busy_times_by_date(occupancy_rows):
+    busy_by_date = {}
+    for row in occupancy_rows:
+        busy_by_date[row.date] = [
+            datetime.combine(row.date, datetime.strptime(slot, "%H:%M").time())
+            for slot in row.busy_slots
+        ]
+    return busy_by_date
+
+def _available_days(start_date, end_date, busy_by_date):
+    days = []
+    current_date = start_date
+    while current_date <= end_date:
+        # Skip weekends and holidays
+        if services.is_working_day(current_date):
+            days.append({
+                "date": current_date.strftime("%Y-%m-%d"),
+                "available_slots": services.calculate_available_slots(
+                    current_date, busy_by_date.get(current_date, [])
+                )
+            })
+        current_date += timedelta(days=1)
+    return days
+
+@app.get("/appointments/available_slots/", dependencies=[Depends(require_scope("appointments:read"))])
+def get_available_slots(agenda: Optional[str] = None, db: Session = Depends(get_read_db)):
     """
     Returns available slots for the next 7 days.
     If 'agenda' is provided, filters by that agenda.
     If not, returns slots grouped by each agenda name.
+    Reads the daily_occupancy summary rather than scanning appointments.
     """
     today = datetime.now().date()
     end_date = today + timedelta(days=7)
 
     if agenda:
         # Single agenda mode - return slots for specific agenda
-        appointments = crud.get_appointments_for_range(db, agenda, today, end_date)
-        
-        # Organize appointments by date
-        appointments_by_date = {}
-        for appt in appointments:
-            appt_date = appt.start_time.date()
-            if appt_date not in appointments_by_date:
-                appointments_by_date[appt_date] = []
-            appointments_by_date[appt_date].append(appt)
-
-        result = {
+        occupancy = crud.get_occupancy_for_range(db, agenda, today, end_date)
+        return {
             "agenda": agenda,
-            "days": []
+            "days": _available_days(today, end_date, _busy_times_by_date(occupancy))
         }
 
-        # Iterate through each day to calculate availability
-        current_date = today
-        while current_date <= end_date:
-            # Skip weekends and holidays
-            if not services.is_working_day(current_date):
-                current_date += timedelta(days=1)
-                continue
-                
-            day_str = current_date.strftime("%Y-%m-%d")
-            day_appointments = appointments_by_date.get(current_date, [])
-            
-            # Calculate available slots for this specific day
-            available_slots = services.calculate_available_slots(current_date, day_appointments)
-            
-            result["days"].append({
-                "date": day_str,
-                "available_slots": available_slots
-            })
-            
-            current_date += timedelta(days=1)
+    # Multi-agenda mode - return slots grouped by each agenda
+    occupancy_by_agenda = {}
+    for row in crud.get_occupancy_for_range(db, None, today, end_date):
+        occupancy_by_agenda.setdefault(row.agenda, []).append(row)
 
-        return result
-    
-    else:
-        # Multi-agenda mode - return slots grouped by each agenda
-        all_appointments = crud.get_appointments_for_range(db, None, today, end_date)
-        
-        # Group appointments by agenda
-        appointments_by_agenda = {}
-        for appt in all_appointments:
-            agenda_name = appt.agenda if appt.agenda else "Unknown"
-            if agenda_name not in appointments_by_agenda:
-                appointments_by_agenda[agenda_name] = []
-            appointments_by_agenda[agenda_name].append(appt)
-        
-        # Calculate slots for each agenda
-        agendas_result = []
-        
-        for agenda_name, agenda_appointments in appointments_by_agenda.items():
-            # Organize by date
-            appointments_by_date = {}
-            for appt in agenda_appointments:
-                appt_date = appt.start_time.date()
-                if appt_date not in appointments_by_date:
-                    appointments_by_date[appt_date] = []
-                appointments_by_date[appt_date].append(appt)
-            
-            days = []
-            current_date = today
-            while current_date <= end_date:
-                # Skip weekends and holidays
-                if not services.is_working_day(current_date):
-                    current_date += timedelta(days=1)
-                    continue
-                    
-                day_str = current_date.strftime("%Y-%m-%d")
-                day_appointments = appointments_by_date.get(current_date, [])
-                
-                # Calculate available slots for this specific day
-                available_slots = services.calculate_available_slots(current_date, day_appointments)
-                
-                days.append({
-                    "date": day_str,
-                    "available_slots": available_slots
-                })
-                
-                current_date += timedelta(days=1)
-            
-            agendas_result.append({
-                "agenda": agenda_name,
-                "days": days
-            })
-        
-        return {"agendas": agendas_result}
+    return {"agendas": [
+        {
+            "agenda": agenda_name,
+            "days": _available_days(today, end_date, _busy_times_by_date(rows))
+        }
+        for agenda_name, rows in occupancy_by_agenda.items()
+    ]}
+
+@app.get("/occupancy/", response_model=List[schemas.DailyOccupancy], dependencies=[Depends(require_scope("appointments:read"))])
+def read_occupancy(
+    start_date: date,
+    end_date: date,
+    agenda: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Daily booked counts and busy slots per agenda, for dashboards.
+    """
+    return crud.get_occupancy_for_range(db, agenda, start_date, end_date)
 
-@app.get("/appointments/{appointment_id}", response_model=schemas.Appointment)
-def read_appointment(appointment_id: int, db: Session = Depends(get_db)):
+@app.get("/appointments/{appointment_id}", response_model=schemas.Appointment, dependencies=[Depends(require_scope("appointments:read"))])
+def read_appointment(appointment_id: int, db: Session = Depends(get_read_db)):
     db_appointment = crud.get_appointment(db, appointment_id=appointment_id)
     if db_appointment is None:
         raise HTTPException(status_code=404, detail="Appointment not found")
     return db_appointment
 
-@app.post("/appointments/sync/")
+@app.post("/appointments/sync/", dependencies=[Depends(require_scope("appointments:sync"))])
 def sync_appointments(appointments: List[schemas.AppointmentCreate], db: Session = Depends(get_db)):
     if not appointments:
         return {"status": "skipped", "message": "Empty list provided"}
     
-    return crud.sync_appointments(db, appointments)
+    for attempt in range(OCCUPANCY_REFRESH_ATTEMPTS):
+        try:
+            result = crud.sync_appointments(db, appointments)
+            break
+        except IntegrityError:
+            # A concurrent booking wrote into the window first; redo the whole sync on top of it
+            db.rollback()
+    else:
+        logger.warning("Sync of %d appointments kept colliding with concurrent bookings", len(appointments))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Sync collided with concurrent bookings, please retry."
+        )
+
+    SYNC_ROWS.inc(len(appointments), action="received")
+    SYNC_ROWS.inc(result["created"], action="created")
+    SYNC_ROWS.inc(result["deleted"], action="deleted")
+    return result
 
 
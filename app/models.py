@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Date, JSON
 from .database import Base
 
 class Appointment(Base):
@@ -12,3 +12,15 @@ class Appointment(Base):
     agenda = Column(String, nullable=True)  # Dr. Soler
     center = Column(String, nullable=True)  # Centro
     visit_type = Column(String, nullable=True)  # Tipo Visita
+
+
+class DailyOccupancy(Base):
+    """
+    Per agenda and day booking summary, refreshed from appointments by sync and on booking.
+    """
+    __tablename__ = "daily_occupancy"
+
+    agenda = Column(String, primary_key=True)  # "Unknown" for appointments without agenda
+    date = Column(Date, primary_key=True, index=True)
+    booked_count = Column(Integer, nullable=False, default=0)
+    busy_slots = Column(JSON, nullable=False, default=list)  # ["09:00", "09:15", ...]
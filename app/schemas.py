@@ -1,6 +1,6 @@
 from pydantic import BaseModel
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, date
+from typing import List, Optional
 
 class AppointmentBase(BaseModel):
     doctor_name: str
@@ -20,3 +20,12 @@ class Appointment(AppointmentBase):
 
     class Config:
         from_attributes = True
+
+class DailyOccupancy(BaseModel):
+    agenda: str
+    date: date
+    booked_count: int
+    busy_slots: List[str]
+
+    class Config:
+        from_attributes = True
@@ -1,31 +1,222 @@
+import hashlib
+import hmac
+import json
+import logging
 import os
-from fastapi import HTTPException, Security, status
+import signal
+import threading
+import time
+from typing import Dict, FrozenSet, List, Optional
+
+from fastapi import HTTPException, Request, Security, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
+logger = logging.getLogger("api.security")
+
 # Security Scheme
 security = HTTPBearer()
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)):
+# Tokens are configured in a JSON file (API_TOKENS_FILE) holding only SHA-256 hashes:
+#
+#   {"tokens": [
+#       {"client": "scheduler", "sha256": "<hex>", "scopes": ["robots:run"], "rate_limit": 1, "burst": 5},
+#       {"client": "web", "sha256": "<hex>", "scopes": ["appointments:read", "appointments:write"]},
+#       {"client": "api", "sha256": "<hex>", "scopes": ["robots:run"]}
+#   ]}
+#
+# rate_limit is in requests/second (omit for unlimited). The scope "*" grants everything.
+# Generate a hash with: python -m app.security hash <token>
+# If no file is configured, API_BEARER_TOKEN is accepted as a single all-scopes token.
+# The file is reloaded when it changes on disk or when the process receives SIGHUP.
+# A reload that fails (missing or half-written file) keeps the previously loaded tokens.
+# The API calls the Host Agent with its own HOST_AGENT_TOKEN (the "api" client above).
+RELOAD_CHECK_SECONDS = 5
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self) -> float:
+        """
+        Takes one token. Returns 0 on success, otherwise the seconds until one is available.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class Client:
+    def __init__(self, name: str, token_hash: bytes, scopes: FrozenSet[str], bucket: Optional[TokenBucket] = None):
+        self.name = name
+        self.token_hash = token_hash
+        self.scopes = scopes
+        self.bucket = bucket
+
+    def has_scope(self, scope: str) -> bool:
+        return "*" in self.scopes or scope in self.scopes
+
+
+class TokenStore:
     """
-    Verifies the Bearer token against the API_BEARER_TOKEN environment variable.
+    Loads the configured tokens once and keeps them in memory, reloading on change.
     """
-    token = credentials.credentials
-    expected_token = os.getenv("API_BEARER_TOKEN")
-    
-    # If no token is set in env, we might want to fail safe or allow default for dev.
-    # For security, let's assume it must be set.
-    if not expected_token:
-        # Fallback for local dev comfort if user forgot, but warn or ensure user sets it.
-        # Ideally, we reject if not configured.
+
+    def __init__(self):
+        self.clients: Optional[List[Client]] = None
+        self.path: Optional[str] = None
+        self.mtime: Optional[float] = None
+        self.last_check = 0.0
+        self.reload_requested = False
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        # Called from the SIGHUP handler; the reload itself happens on the next request
+        self.reload_requested = True
+
+    def get_clients(self) -> List[Client]:
+        clients = self.clients
+        now = time.monotonic()
+        if (clients is not None and not self.reload_requested
+                and (self.path is None or now - self.last_check < RELOAD_CHECK_SECONDS)):
+            return clients
+
+        with self.lock:
+            self.last_check = now
+            if self.clients is None or self.reload_requested or self._file_changed():
+                self.reload_requested = False
+                try:
+                    self.clients = self._load()
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    if self.clients is None:
+                        # Nothing ever loaded: fail closed until the file is fixed
+                        logger.error("Could not load API tokens: %s", e)
+                        return []
+                    logger.error("Could not reload API tokens, keeping the previous set: %s", e)
+            return self.clients
+
+    def _file_changed(self) -> bool:
+        try:
+            return os.path.getmtime(self.path) != self.mtime
+        except OSError:
+            return False
+
+    def _load(self) -> List[Client]:
+        self.path = os.getenv("API_TOKENS_FILE")
+        if not self.path:
+            expected_token = os.getenv("API_BEARER_TOKEN")
+            if not expected_token:
+                return []
+            return [Client("default", bytes.fromhex(hash_token(expected_token)), frozenset(["*"]))]
+
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, "r") as f:
+            config = json.load(f)
+
+        # Keep existing buckets so a reload does not reset everyone's rate limit
+        old_buckets: Dict[str, TokenBucket] = {c.name: c.bucket for c in (self.clients or []) if c.bucket}
+        clients = []
+        for entry in config.get("tokens", []):
+            bucket = None
+            if entry.get("rate_limit"):
+                rate = float(entry["rate_limit"])
+                burst = float(entry.get("burst", max(1, rate)))
+                bucket = old_buckets.get(entry["client"])
+                if bucket is None or (bucket.rate, bucket.burst) != (rate, burst):
+                    bucket = TokenBucket(rate, burst)
+            clients.append(Client(
+                entry["client"],
+                bytes.fromhex(entry["sha256"]),
+                frozenset(entry.get("scopes", [])),
+                bucket,
+            ))
+        # Only remember the mtime once the file parsed, so a bad file keeps being retried
+        self.mtime = mtime
+        logger.info("Loaded %d API tokens from %s", len(clients), self.path)
+        return clients
+
+
+token_store = TokenStore()
+
+if hasattr(signal, "SIGHUP"):
+    try:
+        signal.signal(signal.SIGHUP, lambda signum, frame: token_store.invalidate())
+    except ValueError:
+        # Not imported from the main thread; file change detection still applies
+        pass
+
+
+def verify_token(request: Request, credentials: HTTPAuthorizationCredentials = Security(security)) -> Client:
+    """
+    Verifies the Bearer token against the configured tokens and applies the client's rate limit.
+    The resolved client is stored on request.state.client for scope checks.
+    """
+    clients = token_store.get_clients()
+    if not clients:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="API_BEARER_TOKEN not configured on server"
+            detail="No API tokens configured on server"
         )
 
-    if token != expected_token:
+    # Compare against every configured token so timing does not reveal which one matched
+    token_hash = bytes.fromhex(hash_token(credentials.credentials))
+    client = None
+    for candidate in clients:
+        if hmac.compare_digest(candidate.token_hash, token_hash):
+            client = candidate
+
+    if client is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return token
+
+    if client.bucket:
+        retry_after = client.bucket.consume()
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(max(1, round(retry_after)))},
+            )
+
+    request.state.client = client
+    return client
+
+
+def require_scope(scope: str):
+    """
+    Route dependency checking a scope on the client resolved by verify_token,
+    without verifying the token again.
+    """
+    def check_scope(request: Request):
+        client = getattr(request.state, "client", None)
+        if client is None or not client.has_scope(scope):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Token lacks the '{scope}' scope",
+            )
+    return check_scope
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) == 3 and sys.argv[1] == "hash":
+        print(hash_token(sys.argv[2]))
+    else:
+        print("Usage: python -m app.security hash <token>")
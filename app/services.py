@@ -1,7 +1,10 @@
 import os
+import logging
 import requests
 from datetime import datetime, time, timedelta, date
 
+logger = logging.getLogger("api.services")
+
 def is_working_day(date_obj):
     """
     Check if a date is a working day (not weekend or Spanish holiday in Comunidad Valenciana).
@@ -53,13 +56,20 @@ def is_working_day(date_obj):
     
     return date_obj not in all_holidays
 
-def execute_robot_task(appointment_data: dict, token: str):
+def execute_robot_task(appointment_data: dict):
     """
     Triggers the 'agendar_cita' robot on the Host Agent.
+    Authenticates with the API's own HOST_AGENT_TOKEN (needs the robots:run scope),
+    falling back to API_BEARER_TOKEN for single-token setups.
     """
     host_agent_url = os.getenv("HOST_AGENT_URL", "http://host.docker.internal:8001")
     url = f"{host_agent_url}/run-robot/agendar_cita"
     
+    token = os.getenv("HOST_AGENT_TOKEN") or os.getenv("API_BEARER_TOKEN")
+    if not token:
+        logger.error("HOST_AGENT_TOKEN not set, cannot trigger robot for %s", appointment_data.get("patient_name"))
+        return
+
     headers = {"Authorization": f"Bearer {token}"}
     
     # Payload expected by the robot
@@ -68,16 +78,20 @@ def execute_robot_task(appointment_data: dict, token: str):
     }
     
     try:
-        print(f"Triggering robot at {url} with data: {appointment_data}")
+        logger.info("Triggering robot at %s", url)
+        logger.debug("Robot payload: %s", appointment_data)
         # We use a long timeout just in case, but since this is bg task, it's fine.
         response = requests.post(url, json=payload, headers=headers, timeout=600)
-        print(f"Robot trigger response: {response.status_code} - {response.text}")
+        if response.status_code == 200:
+            logger.info("Robot trigger response: %s - %s", response.status_code, response.text)
+        else:
+            logger.error("Robot trigger failed: %s - %s", response.status_code, response.text)
     except Exception as e:
-        print(f"Failed to trigger robot: {e}")
+        logger.error("Failed to trigger robot: %s", e)
 
-def calculate_available_slots(date_obj, existing_appointments):
+def calculate_available_slots(date_obj, busy_times):
     """
-    Calculates available 15-minute slots for a specific date given existing appointments.
+    Calculates available 15-minute slots for a specific date given the start times already booked.
     Working hours: 09:00-14:00, 16:00-20:00.
     """
     # Define working hours
@@ -111,9 +125,7 @@ def calculate_available_slots(date_obj, existing_appointments):
     if date_obj == now_adjusted.date():
         possible_slots = [slot for slot in possible_slots if slot > now_adjusted]
 
-    # Create a set of occupied start times
-    busy_times = {appt.start_time for appt in existing_appointments}
-
+    busy_times = set(busy_times)
     available = [slot for slot in possible_slots if slot not in busy_times]
     
     return available
@@ -9,14 +9,20 @@ import subprocess
 import os
 import sys
 import logging
+import time
+from contextlib import asynccontextmanager
 
 try:
-    from app.security import verify_token
+    from app.security import verify_token, require_scope
+    from app import metrics
 except ImportError:
     # Handle case where 'app' is not in python path directly (though it should be if run from root)
     # We can append current dir to path or assume user runs correctly
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-    from app.security import verify_token
+    from app.security import verify_token, require_scope
+    from app import metrics
+
+from robot_worker import RobotWorker, RobotWorkerError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,7 +32,7 @@ logger = logging.getLogger("host_agent")
 ROBOTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "robots")
 ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
 
-# Pre-load ENV to os.environ for app.security to work
+# Pre-load ENV to os.environ for app.security to work (tokens are read on the first request)
 if os.path.exists(ENV_FILE):
     with open(ENV_FILE, "r") as f:
         for line in f:
@@ -38,11 +44,64 @@ if os.path.exists(ENV_FILE):
             if key not in os.environ:
                  os.environ[key] = value
 
-app = FastAPI(dependencies=[Depends(verify_token)])
+# Warm worker mode: keep one logged-in RDP session alive and send it jobs.
+# Leave ROBOT_WORKER unset to spawn a fresh robot process per request.
+# For local testing without RDP: ROBOT_WORKER=robots/fake_robot/worker.py
+ROBOT_WORKER = os.getenv("ROBOT_WORKER")
+ROBOT_WORKER_ROBOTS = [
+    name.strip() for name in os.getenv("ROBOT_WORKER_ROBOTS", "agendar_cita,listar_citas").split(",") if name.strip()
+]
+ROBOT_WORKER_MAX_JOBS = int(os.getenv("ROBOT_WORKER_MAX_JOBS", 50))
+ROBOT_WORKER_HEALTH_INTERVAL = int(os.getenv("ROBOT_WORKER_HEALTH_INTERVAL", 60))
 
 # Global lock for serial execution
 robot_lock = asyncio.Lock()
 
+robot_worker: Optional[RobotWorker] = None
+
+# Background re-warm after a job stopped the worker (kept so it is not garbage-collected)
+rewarm_task: Optional[asyncio.Task] = None
+
+ROBOT_QUEUE_SECONDS = metrics.Histogram(
+    "robot_queue_wait_seconds",
+    "Time a robot request waited for the robot lock.",
+    ["robot"],
+    buckets=(0.01, 0.1, 1, 5, 15, 30, 60, 120, 300, 600),
+)
+ROBOT_RUN_SECONDS = metrics.Histogram(
+    "robot_run_duration_seconds",
+    "Robot execution time once the lock was acquired.",
+    ["robot", "status"],
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600),
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global robot_worker
+    health_task = None
+    if ROBOT_WORKER:
+        robot_worker = RobotWorker(
+            get_command(resolve_robot_path(ROBOT_WORKER)),
+            env=get_robot_env(),
+            max_jobs=ROBOT_WORKER_MAX_JOBS,
+        )
+        health_task = asyncio.create_task(keep_worker_warm())
+
+    yield
+
+    if health_task:
+        health_task.cancel()
+    if rewarm_task:
+        rewarm_task.cancel()
+    if robot_worker:
+        async with robot_lock:
+            await robot_worker.stop()
+
+
+app = FastAPI(dependencies=[Depends(verify_token)], lifespan=lifespan)
+metrics.instrument(app, dependencies=[Depends(require_scope("metrics:read"))])
+
 class RobotRequest(BaseModel):
     payload: Optional[Dict[str, Any]] = None
 
@@ -81,14 +140,117 @@ def get_robot_env():
         
     return env
 
-@app.post("/run-robot/{robot_name}")
+def resolve_robot_path(path):
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+def get_command(script_path):
+    if script_path.endswith(".exe"):
+        return [script_path]
+    return [sys.executable, script_path]
+
+def get_robot_args(robot_name, payload):
+    """
+    Converts the request payload into the command line arguments the robot expects.
+    """
+    if not payload:
+        return []
+
+    # Special handling for agendar_cita robot - expects individual arguments
+    if robot_name == "agendar_cita":
+        # Extract fields in the order expected by the robot
+        # agendar_cita.exe "patient_name" "agenda" "start_time" "speciality" "visit_type"
+
+        # Map the fields - note: we don't have speciality in DB, so we'll use agenda or a default
+        patient_name = payload.get("patient_name", "")
+        agenda = payload.get("agenda", "")
+        start_time = payload.get("start_time", "")
+        # Always use Oftalmologia as the speciality
+        speciality = "Oftalmologia"
+        visit_type = payload.get("visit_type", "")
+
+        args = [patient_name, agenda, start_time, speciality, visit_type]
+        logger.info(f"agendar_cita arguments: {args}")
+        return args
+
+    # For other robots, pass as JSON string
+    return [json.dumps(payload)]
+
+@asynccontextmanager
+async def robot_slot(robot_name):
+    """
+    Holds robot_lock for one robot run, recording queue wait and run time.
+    """
+    queued_at = time.perf_counter()
+    async with robot_lock:
+        started_at = time.perf_counter()
+        ROBOT_QUEUE_SECONDS.observe(started_at - queued_at, robot=robot_name)
+        run_status = "error"
+        try:
+            yield
+            run_status = "ok"
+        finally:
+            ROBOT_RUN_SECONDS.observe(time.perf_counter() - started_at, robot=robot_name, status=run_status)
+
+async def keep_worker_warm():
+    """
+    Logs the worker in at startup and health-checks it while idle,
+    so requests never pay for the RDP login.
+    """
+    while True:
+        if not robot_lock.locked():
+            try:
+                await warm_worker()
+            except Exception as e:
+                # Never let the health loop die; try again on the next interval
+                logger.exception(f"Robot worker health check crashed: {e}")
+        await asyncio.sleep(ROBOT_WORKER_HEALTH_INTERVAL)
+
+async def warm_worker():
+    async with robot_lock:
+        try:
+            await robot_worker.ensure_ready()
+        except RobotWorkerError as e:
+            logger.error(f"Robot worker unavailable: {e}")
+
+async def run_on_worker(robot_name, args):
+    global rewarm_task
+    try:
+        async with robot_slot(robot_name):
+            logger.info(f"Acquired lock. Sending '{robot_name}' to warm robot worker")
+            try:
+                output = await robot_worker.run(robot_name, args)
+            except RobotWorkerError as e:
+                logger.error(f"Failed to execute robot: {e}")
+                raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not robot_worker.alive and (rewarm_task is None or rewarm_task.done()):
+            # Failed or recycled: log back in now rather than on the next request
+            rewarm_task = asyncio.create_task(warm_worker())
+
+    logger.info(f"Robot finished successfully")
+    return {
+        "status": "completed",
+        "robot": robot_name,
+        "path": ROBOT_WORKER,
+        "output": output
+    }
+
+@app.post("/run-robot/{robot_name}", dependencies=[Depends(require_scope("robots:run"))])
 async def run_robot(robot_name: str, request: RobotRequest = None):
     """
     Executes a robot script/executable.
     Ensures only one robot runs at a time using a global lock.
     """
     logger.info(f"Received request to run robot: {robot_name}")
-    
+
+    if robot_lock.locked():
+        logger.info(f"Robot execution locked. Waiting for other robots to finish...")
+
+    if robot_worker and robot_name in ROBOT_WORKER_ROBOTS:
+        return await run_on_worker(robot_name, get_robot_args(robot_name, request and request.payload))
+
     # Determine the script path
     potential_paths = [
         os.path.join(ROBOTS_DIR, robot_name, f"{robot_name}.exe"),
@@ -108,40 +270,11 @@ async def run_robot(robot_name: str, request: RobotRequest = None):
         raise HTTPException(status_code=404, detail=f"Robot '{robot_name}' not found")
 
     # Acquire lock to ensure serial execution
-    if robot_lock.locked():
-        logger.info(f"Robot execution locked. Waiting for other robots to finish...")
-
-    async with robot_lock:
+    async with robot_slot(robot_name):
         try:
             logger.info(f"Acquired lock. Preparing to execute: {script_path}")
             
-            cmd = []
-            if script_path.endswith(".exe"):
-                cmd = [script_path]
-            else:
-                cmd = [sys.executable, script_path]
-
-            # Special handling for agendar_cita robot - expects individual arguments
-            if request and request.payload:
-                if robot_name == "agendar_cita":
-                    # Extract fields in the order expected by the robot
-                    # agendar_cita.exe "patient_name" "agenda" "start_time" "speciality" "visit_type"
-                    payload = request.payload
-                    
-                    # Map the fields - note: we don't have speciality in DB, so we'll use agenda or a default
-                    patient_name = payload.get("patient_name", "")
-                    agenda = payload.get("agenda", "")
-                    start_time = payload.get("start_time", "")
-                    # Always use Oftalmologia as the speciality
-                    speciality = "Oftalmologia"
-                    visit_type = payload.get("visit_type", "")
-                    
-                    # Add arguments in order
-                    cmd.extend([patient_name, agenda, start_time, speciality, visit_type])
-                    logger.info(f"agendar_cita arguments: {[patient_name, agenda, start_time, speciality, visit_type]}")
-                else:
-                    # For other robots, pass as JSON string
-                    cmd.append(json.dumps(request.payload))
+            cmd = get_command(script_path) + get_robot_args(robot_name, request and request.payload)
 
             logger.info(f"Executing command: {cmd}")
             
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("host_agent.robot_worker")
+
+# Worker protocol (one JSON object per line over stdin/stdout):
+#
+#   worker -> agent  {"status": "ready"}                       once logged in
+#   agent -> worker  {"id": 1, "cmd": "ping"}
+#   worker -> agent  {"id": 1, "status": "ok"}
+#   agent -> worker  {"id": 2, "cmd": "run", "robot": "agendar_cita", "args": [...]}
+#   worker -> agent  {"id": 2, "status": "ok", "output": "..."}
+#                    {"id": 2, "status": "error", "error": "..."}
+#   agent -> worker  {"cmd": "shutdown"}
+#
+# stdout is reserved for the protocol; workers must log to stderr or a file.
+
+# Large enough for a full listar_citas export in a single reply line
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+class RobotWorkerError(Exception):
+    pass
+
+
+class RobotWorker:
+    """
+    A long-lived robot process that keeps the RDP session logged in between jobs.
+    The process is recycled after `max_jobs` jobs or as soon as anything goes wrong.
+    Callers are responsible for serialising access (the Host Agent uses robot_lock).
+    """
+
+    def __init__(
+        self,
+        cmd: List[str],
+        env: Optional[Dict[str, str]] = None,
+        max_jobs: int = 50,
+        start_timeout: float = 180,
+        job_timeout: float = 600,
+        ping_timeout: float = 10,
+    ):
+        self.cmd = cmd
+        self.env = env
+        self.max_jobs = max_jobs
+        self.start_timeout = start_timeout
+        self.job_timeout = job_timeout
+        self.ping_timeout = ping_timeout
+        self.process = None
+        self.jobs_done = 0
+        self._next_id = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        """
+        Spawns the worker and waits until it reports that the session is logged in.
+        """
+        await self.stop()
+        logger.info(f"Starting robot worker: {self.cmd}")
+        self.jobs_done = 0
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *self.cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                env=self.env,
+                limit=STREAM_LIMIT,
+            )
+            message = await self._read(self.start_timeout)
+        except Exception as e:
+            await self.stop()
+            raise RobotWorkerError(f"Robot worker failed to start: {e}")
+
+        if message.get("status") != "ready":
+            await self.stop()
+            raise RobotWorkerError(f"Robot worker failed to start: {message}")
+        logger.info(f"Robot worker ready (pid {self.process.pid})")
+
+    async def stop(self):
+        """
+        Asks the worker to log out and exit, killing it if it does not comply.
+        """
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        if process.returncode is not None:
+            return
+
+        logger.info(f"Stopping robot worker (pid {process.pid})")
+        try:
+            process.stdin.write(b'{"cmd": "shutdown"}\n')
+            await process.stdin.drain()
+            await asyncio.wait_for(process.wait(), 15)
+        except Exception:
+            process.kill()
+            await process.wait()
+
+    async def ping(self) -> bool:
+        if not self.alive:
+            return False
+        try:
+            reply = await self._request({"cmd": "ping"}, self.ping_timeout)
+        except Exception as e:
+            logger.warning(f"Robot worker health check failed: {e}")
+            return False
+        return reply.get("status") == "ok"
+
+    async def ensure_ready(self):
+        """
+        Makes sure a healthy, logged-in worker is available, (re)starting it if needed.
+        """
+        if not await self.ping():
+            await self.start()
+
+    async def run(self, robot_name: str, args: List[str]) -> str:
+        """
+        Runs one job on the warm session and returns the worker's output.
+        """
+        await self.ensure_ready()
+
+        try:
+            reply = await self._request(
+                {"cmd": "run", "robot": robot_name, "args": args}, self.job_timeout
+            )
+        except Exception as e:
+            await self.stop()
+            raise RobotWorkerError(f"Robot worker crashed during '{robot_name}': {e}")
+
+        self.jobs_done += 1
+        if reply.get("status") != "ok":
+            # The session may be left on an unexpected screen, start clean next time
+            await self.stop()
+            raise RobotWorkerError(reply.get("error") or f"Robot '{robot_name}' failed")
+
+        if self.jobs_done >= self.max_jobs:
+            logger.info(f"Robot worker reached {self.max_jobs} jobs, recycling")
+            await self.stop()
+
+        return reply.get("output", "")
+
+    async def _request(self, message: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        self._next_id += 1
+        request_id = self._next_id
+        self.process.stdin.write((json.dumps(dict(message, id=request_id)) + "\n").encode())
+        await self.process.stdin.drain()
+
+        while True:
+            reply = await self._read(timeout)
+            if reply.get("id") == request_id:
+                return reply
+            logger.warning(f"Discarding stale robot worker reply: {reply}")
+
+    async def _read(self, timeout: float) -> Dict[str, Any]:
+        line = await asyncio.wait_for(self.process.stdout.readline(), timeout)
+        if not line:
+            raise RobotWorkerError(f"Robot worker exited with code {await self.process.wait()}")
+        return json.loads(line)
@@ -0,0 +1,76 @@
+"""
+Fake robot worker for exercising the Host Agent's warm worker mode without RDP.
+
+Speaks the same stdin/stdout protocol as a real robot worker (see robot_worker.py).
+
+Usage:
+    set ROBOT_WORKER=robots/fake_robot/worker.py
+    python host_agent.py
+
+Optional environment variables:
+    FAKE_ROBOT_LOGIN_SECONDS  simulated RDP login time (default 2)
+    FAKE_ROBOT_JOB_SECONDS    simulated time per job (default 0.5)
+    FAKE_ROBOT_FAIL_EVERY     make every Nth job fail (default 0, never)
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+logging.basicConfig(
+    stream=sys.stderr,
+    level=logging.INFO,
+    format='%(asctime)s - fake_robot - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("fake_robot")
+
+LOGIN_SECONDS = float(os.getenv("FAKE_ROBOT_LOGIN_SECONDS", 2))
+JOB_SECONDS = float(os.getenv("FAKE_ROBOT_JOB_SECONDS", 0.5))
+FAIL_EVERY = int(os.getenv("FAKE_ROBOT_FAIL_EVERY", 0))
+
+
+def reply(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def run_job(robot_name, args):
+    time.sleep(JOB_SECONDS)
+    if robot_name == "agendar_cita":
+        return f"Booked {args[0] if args else '?'} at {args[2] if len(args) > 2 else '?'}"
+    return f"{robot_name} finished with args {args}"
+
+
+def main():
+    logger.info(f"Launching fake RDP session (pid {os.getpid()})...")
+    time.sleep(LOGIN_SECONDS)
+    logger.info("Login submitted.")
+    reply({"status": "ready"})
+
+    jobs_done = 0
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        message = json.loads(line)
+        cmd = message.get("cmd")
+
+        if cmd == "shutdown":
+            logger.info("Logging out.")
+            break
+        elif cmd == "ping":
+            reply({"id": message.get("id"), "status": "ok"})
+        elif cmd == "run":
+            jobs_done += 1
+            robot_name = message.get("robot")
+            logger.info(f"Running job {jobs_done}: {robot_name}")
+            if FAIL_EVERY and jobs_done % FAIL_EVERY == 0:
+                reply({"id": message.get("id"), "status": "error", "error": f"Simulated failure in {robot_name}"})
+                continue
+            reply({"id": message.get("id"), "status": "ok", "output": run_job(robot_name, message.get("args", []))})
+        else:
+            reply({"id": message.get("id"), "status": "error", "error": f"Unknown command: {cmd}"})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# Point the app at a throwaway SQLite file before app.database is imported
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ.pop("REPLICA_DATABASE_URL", None)
+os.environ.pop("API_TOKENS_FILE", None)
+
+TEST_TOKEN = "test-token"
+
+
+@pytest.fixture
+def token_store(monkeypatch):
+    """
+    A fresh token store using the API_BEARER_TOKEN fallback.
+    """
+    from app import security
+
+    monkeypatch.setenv("API_BEARER_TOKEN", TEST_TOKEN)
+    monkeypatch.delenv("API_TOKENS_FILE", raising=False)
+    store = security.TokenStore()
+    monkeypatch.setattr(security, "token_store", store)
+    return store
+
+
+@pytest.fixture
+def db():
+    from app import database, models
+
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(db, token_store):
+    from fastapi.testclient import TestClient
+    from app import main
+
+    return TestClient(main.app, headers={"Authorization": f"Bearer {TEST_TOKEN}"})
@@ -0,0 +1,160 @@
+"""
+The daily_occupancy summary and the endpoints reading it, on SQLite.
+"""
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app import crud, models, schemas, services
+
+
+def upcoming_working_days():
+    # Tomorrow onwards, so no slot is filtered out for having already passed
+    today = date.today()
+    return [day for day in (today + timedelta(days=n) for n in range(1, 8)) if services.is_working_day(day)]
+
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, time(hour, minute))
+
+
+def appointment(start_time, agenda="Dr. Soler", doctor_name="Dr. Soler", **extra):
+    return schemas.AppointmentCreate(
+        doctor_name=doctor_name,
+        patient_name="Doe, John",
+        start_time=start_time,
+        agenda=agenda,
+        trigger_robot=False,
+        **extra
+    )
+
+
+def occupancy(db):
+    return {
+        (row.agenda, row.date): (row.booked_count, row.busy_slots)
+        for row in db.query(models.DailyOccupancy)
+    }
+
+
+def available_on(client, day, agenda="Dr. Soler"):
+    response = client.get("/appointments/available_slots/", params={"agenda": agenda})
+    assert response.status_code == 200
+    for entry in response.json()["days"]:
+        if entry["date"] == day.isoformat():
+            return {datetime.fromisoformat(slot).strftime("%H:%M") for slot in entry["available_slots"]}
+    raise AssertionError(f"{day} missing from available_slots")
+
+
+def test_refresh_aggregates_per_agenda_and_day(db):
+    day = date(2030, 1, 2)
+    for appt in [
+        appointment(at(day, 10, 15)),
+        appointment(at(day, 9, 0)),
+        appointment(at(day, 9, 0), agenda="Dr. Other", doctor_name="Dr. Other"),
+        appointment(at(day, 12, 0), agenda=None, doctor_name="Dr. Other"),
+        appointment(at(day + timedelta(days=1), 16, 0)),
+    ]:
+        crud.create_appointment(db, appt)
+
+    crud.refresh_daily_occupancy(db, day, day + timedelta(days=1))
+    db.commit()
+
+    assert occupancy(db) == {
+        ("Dr. Soler", day): (2, ["09:00", "10:15"]),
+        ("Dr. Other", day): (1, ["09:00"]),
+        ("Unknown", day): (1, ["12:00"]),
+        ("Dr. Soler", day + timedelta(days=1)): (1, ["16:00"]),
+    }
+
+    # Refreshing one agenda leaves the others alone and drops days that emptied out
+    db.query(models.Appointment).filter(models.Appointment.agenda == "Dr. Soler").delete()
+    crud.refresh_daily_occupancy(db, day, day + timedelta(days=1), "Dr. Soler")
+    db.commit()
+
+    assert occupancy(db) == {
+        ("Dr. Other", day): (1, ["09:00"]),
+        ("Unknown", day): (1, ["12:00"]),
+    }
+
+
+def test_backfill_only_fills_an_empty_table(db):
+    first_day = date(2030, 1, 2)
+    last_day = date(2030, 3, 4)
+    crud.create_appointment(db, appointment(at(first_day, 9)))
+    crud.create_appointment(db, appointment(at(last_day, 17, 45)))
+
+    crud.backfill_daily_occupancy(db)
+    assert occupancy(db) == {
+        ("Dr. Soler", first_day): (1, ["09:00"]),
+        ("Dr. Soler", last_day): (1, ["17:45"]),
+    }
+
+    # Already populated: later rows are left to create/sync
+    crud.create_appointment(db, appointment(at(first_day, 10)))
+    crud.backfill_daily_occupancy(db)
+    assert occupancy(db)[("Dr. Soler", first_day)] == (1, ["09:00"])
+
+
+def test_available_slots_follow_bookings_and_syncs(client):
+    day = upcoming_working_days()[0]
+    assert "10:00" in available_on(client, day)
+
+    response = client.post("/appointments/", json=appointment(at(day, 10)).model_dump(mode="json"))
+    assert response.status_code == 200
+    assert "10:00" not in available_on(client, day)
+
+    # The sync window (09:00-11:00) no longer contains the 10:00 booking, so it is deleted
+    response = client.post("/appointments/sync/", json=[
+        appointment(at(day, 9)).model_dump(mode="json"),
+        appointment(at(day, 11)).model_dump(mode="json"),
+    ])
+    assert response.status_code == 200
+    assert response.json()["deleted"] == 1
+    assert response.json()["created"] == 2
+
+    available = available_on(client, day)
+    assert "10:00" in available
+    assert not {"09:00", "11:00"} & available
+
+
+def test_appointments_without_agenda_land_in_unknown(client):
+    day = upcoming_working_days()[0]
+    response = client.post("/appointments/sync/", json=[
+        appointment(at(day, 9, 30), agenda=None).model_dump(mode="json"),
+    ])
+    assert response.status_code == 200
+
+    response = client.get("/occupancy/", params={"start_date": day.isoformat(), "end_date": day.isoformat()})
+    assert response.json() == [
+        {"agenda": "Unknown", "date": day.isoformat(), "booked_count": 1, "busy_slots": ["09:30"]},
+    ]
+
+    agendas = client.get("/appointments/available_slots/").json()["agendas"]
+    assert [entry["agenda"] for entry in agendas] == ["Unknown"]
+    assert "09:30" not in available_on(client, day, agenda="Unknown")
+
+
+def test_sync_is_retried_as_a_whole_after_a_collision(client, db, monkeypatch):
+    day = upcoming_working_days()[0]
+    refresh = crud.refresh_daily_occupancy
+    calls = []
+
+    def colliding_refresh(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise IntegrityError("INSERT INTO daily_occupancy", {}, Exception("duplicate key"))
+        return refresh(*args, **kwargs)
+
+    monkeypatch.setattr(crud, "refresh_daily_occupancy", colliding_refresh)
+
+    response = client.post("/appointments/sync/", json=[
+        appointment(at(day, 9)).model_dump(mode="json"),
+        appointment(at(day, 10)).model_dump(mode="json"),
+    ])
+    assert response.status_code == 200
+    assert response.json()["created"] == 2
+    assert len(calls) == 2
+
+    # The first attempt was rolled back, so nothing was inserted twice
+    assert db.query(models.Appointment).count() == 2
+    assert occupancy(db) == {("Dr. Soler", day): (2, ["09:00", "10:00"])}
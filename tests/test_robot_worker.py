@@ -0,0 +1,112 @@
+"""
+Drives RobotWorker against the fake robot worker, so no RDP session is needed.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from robot_worker import RobotWorker, RobotWorkerError
+
+FAKE_WORKER = os.path.join(ROOT_DIR, "robots", "fake_robot", "worker.py")
+
+
+def make_worker(max_jobs=50, fail_every=0, cmd=None):
+    env = dict(
+        os.environ,
+        FAKE_ROBOT_LOGIN_SECONDS="0",
+        FAKE_ROBOT_JOB_SECONDS="0",
+        FAKE_ROBOT_FAIL_EVERY=str(fail_every),
+    )
+    return RobotWorker(cmd or [sys.executable, FAKE_WORKER], env=env, max_jobs=max_jobs, start_timeout=10, job_timeout=10)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_start_and_run_reuses_the_same_session():
+    async def scenario():
+        worker = make_worker()
+        await worker.start()
+        pid = worker.process.pid
+        try:
+            output = await worker.run("agendar_cita", ["Doe, John", "Dr. Soler", "2030-01-02T10:00:00"])
+            assert output == "Booked Doe, John at 2030-01-02T10:00:00"
+            await worker.run("listar_citas", [])
+            assert worker.alive
+            assert worker.process.pid == pid
+            assert worker.jobs_done == 2
+        finally:
+            await worker.stop()
+
+    run(scenario())
+
+
+def test_failed_job_recycles_the_worker():
+    async def scenario():
+        worker = make_worker(fail_every=2)
+        try:
+            await worker.run("agendar_cita", [])
+            first_pid = worker.process.pid
+            with pytest.raises(RobotWorkerError, match="Simulated failure"):
+                await worker.run("agendar_cita", [])
+            assert not worker.alive
+
+            # The next job logs in again on a fresh process
+            await worker.run("agendar_cita", [])
+            assert worker.alive
+            assert worker.process.pid != first_pid
+            assert worker.jobs_done == 1
+        finally:
+            await worker.stop()
+
+    run(scenario())
+
+
+def test_worker_is_recycled_after_max_jobs():
+    async def scenario():
+        worker = make_worker(max_jobs=2)
+        try:
+            await worker.run("listar_citas", [])
+            assert worker.alive
+            await worker.run("listar_citas", [])
+            assert not worker.alive
+        finally:
+            await worker.stop()
+
+    run(scenario())
+
+
+def test_health_check_restarts_a_dead_worker():
+    async def scenario():
+        worker = make_worker()
+        try:
+            await worker.start()
+            old_process = worker.process
+            old_process.kill()
+            await old_process.wait()
+
+            assert not await worker.ping()
+            await worker.ensure_ready()
+            assert worker.alive
+            assert worker.process is not old_process
+            assert await worker.ping()
+        finally:
+            await worker.stop()
+
+    run(scenario())
+
+
+def test_missing_executable_raises_robot_worker_error():
+    async def scenario():
+        worker = make_worker(cmd=[os.path.join(ROOT_DIR, "robots", "missing.exe")])
+        with pytest.raises(RobotWorkerError, match="failed to start"):
+            await worker.start()
+        assert not worker.alive
+
+    run(scenario())
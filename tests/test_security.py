@@ -0,0 +1,127 @@
+"""
+Token checks, scopes and rate limiting, exercised through the API on SQLite.
+"""
+import json
+
+import pytest
+
+from app import security
+from conftest import TEST_TOKEN
+
+
+def auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def tokens_file(tmp_path, monkeypatch, db):
+    """
+    Writes a tokens file and installs a fresh store reading it.
+    """
+    path = tmp_path / "tokens.json"
+
+    def write(entries):
+        path.write_text(json.dumps({"tokens": entries}))
+        monkeypatch.setenv("API_TOKENS_FILE", str(path))
+        store = security.TokenStore()
+        monkeypatch.setattr(security, "token_store", store)
+        return store
+
+    write.path = path
+    return write
+
+
+def token_entry(client, token, scopes, **extra):
+    return dict(client=client, sha256=security.hash_token(token), scopes=scopes, **extra)
+
+
+def test_bearer_token_fallback_grants_every_scope(client):
+    assert client.get("/appointments/").status_code == 200
+    assert client.post("/appointments/sync/", json=[]).status_code == 200
+    assert client.get("/metrics").status_code == 200
+
+
+def test_invalid_token_is_rejected(client):
+    response = client.get("/appointments/", headers=auth("wrong-token"))
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+
+
+def test_no_configured_tokens_is_a_server_error(client, monkeypatch):
+    monkeypatch.delenv("API_BEARER_TOKEN")
+    monkeypatch.setattr(security, "token_store", security.TokenStore())
+
+    response = client.get("/appointments/")
+    assert response.status_code == 500
+    assert response.json()["detail"] == "No API tokens configured on server"
+
+
+def test_file_tokens_are_limited_to_their_scopes(tokens_file):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    tokens_file([token_entry("web", "web-token", ["appointments:read"])])
+    client = TestClient(app, headers=auth("web-token"))
+
+    assert client.get("/appointments/").status_code == 200
+    response = client.post("/appointments/sync/", json=[])
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Token lacks the 'appointments:sync' scope"
+    # The env token is ignored once a file is configured
+    assert client.get("/appointments/", headers=auth(TEST_TOKEN)).status_code == 401
+
+
+def test_rate_limited_client_gets_retry_after(tokens_file):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    tokens_file([token_entry("scheduler", "scheduler-token", ["*"], rate_limit=0.5, burst=2)])
+    client = TestClient(app, headers=auth("scheduler-token"))
+
+    assert client.get("/appointments/").status_code == 200
+    assert client.get("/appointments/").status_code == 200
+    response = client.get("/appointments/")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_failed_reload_keeps_the_previous_tokens(tokens_file):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    store = tokens_file([token_entry("web", "web-token", ["appointments:read"])])
+    client = TestClient(app, headers=auth("web-token"))
+    assert client.get("/appointments/").status_code == 200
+    loaded = store.clients
+
+    # A half-written file followed by SIGHUP must not lock everyone out
+    tokens_file.path.write_text('{"tokens": [')
+    store.invalidate()
+    assert client.get("/appointments/").status_code == 200
+    assert store.clients is loaded
+
+
+def test_token_is_verified_once_per_request(client, monkeypatch):
+    store = security.token_store
+    calls = []
+    get_clients = store.get_clients
+
+    def counting_get_clients():
+        calls.append(1)
+        return get_clients()
+
+    monkeypatch.setattr(store, "get_clients", counting_get_clients)
+
+    assert client.get("/appointments/").status_code == 200
+    assert len(calls) == 1
+
+    calls.clear()
+    response = client.post("/appointments/", json={
+        "doctor_name": "Dr. Soler",
+        "patient_name": "Doe, John",
+        "start_time": "2030-01-02T10:00:00",
+        "end_time": "2030-01-02T10:30:00",
+        "trigger_robot": False,
+    })
+    assert response.status_code == 200
+    assert len(calls) == 1